@@ -61,6 +61,77 @@ def _sum_concordant_disc(s, t, d, s_idx, is_concordant_func):
                 count += is_concordant_func(s[idx, i], s[idx, j], t[i], t[j], d[i], d[j])
     return count
 
+@numba.jit(nopython=True)
+def _fenwick_add(tree, i):
+    while i < tree.shape[0]:
+        tree[i] += 1
+        i += i & (-i)
+
+@numba.jit(nopython=True)
+def _fenwick_sum(tree, i):
+    count = 0
+    while i > 0:
+        count += tree[i]
+        i -= i & (-i)
+    return count
+
+@numba.jit(nopython=True)
+def _sum_concordant_risk(t, d, risk_rank, n_ranks):
+    """Requires `t` sorted by descending time. Individuals are added to a Fenwick tree (over the
+    rank of the risk) as they enter the set of individuals an event can be compared to.
+    """
+    n = t.shape[0]
+    tree = np.zeros(n_ranks + 1, dtype=np.int64)
+    concordant = 0.
+    comparable = 0.
+    n_added = 0
+    start = 0
+    while start < n:
+        stop = start
+        while (stop < n) and (t[stop] == t[start]):
+            stop += 1
+        for k in range(start, stop):
+            if not d[k]:
+                _fenwick_add(tree, risk_rank[k])
+                n_added += 1
+        for k in range(start, stop):
+            if d[k]:
+                lower = _fenwick_sum(tree, risk_rank[k] - 1)
+                equal = _fenwick_sum(tree, risk_rank[k]) - lower
+                concordant += lower + 0.5 * equal
+                comparable += n_added
+        for k in range(start, stop):
+            if d[k]:
+                _fenwick_add(tree, risk_rank[k])
+                n_added += 1
+        start = stop
+    return concordant, comparable
+
+def concordance_index(durations, events, risk):
+    """Harrell's concordance index for risk scores, e.g. the `g(x)` of a Cox model
+    (higher risk means shorter survival).
+    An event at time t is compared with all individuals with longer durations, and with the
+    censored individuals at time t. Ties in risk count 0.5.
+    Computed in O(n log(n)) time with a Fenwick tree.
+
+    Arguments:
+        durations {np.array[n]} -- Event times (or censoring times.)
+        events {np.array[n]} -- Event indicators (0 is censoring).
+        risk {np.array[n]} -- Risk scores.
+
+    Returns:
+        float -- Concordance index.
+    """
+    durations = np.asarray(durations).ravel()
+    events = np.asarray(events, dtype=bool).ravel()
+    risk = np.asarray(risk).ravel()
+    assert durations.shape[0] == events.shape[0] == risk.shape[0]
+    order = np.argsort(-durations, kind='stable')
+    risk_rank = np.unique(risk, return_inverse=True)[1] + 1
+    concordant, comparable = _sum_concordant_risk(durations[order], events[order], risk_rank[order],
+                                                  risk_rank.max(initial=0))
+    return concordant / comparable
+
 def concordance_td(durations, events, surv, surv_idx, method='adj_antolini'):
     """Time dependent concorance index from
     Antolini, L.; Boracchi, P.; and Biganzoli, E. 2005. A timedependent discrimination
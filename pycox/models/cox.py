@@ -2,24 +2,42 @@ import os
 import warnings
 import numpy as np
 import pandas as pd
+import joblib
 import torch
 import torchtuples as tt
 from pycox import models
+from pycox.evaluation.concordance import concordance_index
 
 def search_sorted_idx(array, values):
     '''For sorted array, get index of values.
     If value not in array, give left index of value.
     '''
-    n = len(array)
-    idx = np.searchsorted(array, values)
-    idx[idx == n] = n-1 # We can't have indexes higher than the length-1
-    not_exact = values != array[idx]
-    idx -= not_exact
-    if any(idx < 0):
+    array, values = np.asarray(array), np.asarray(values)
+    if np.can_cast(values.dtype, array.dtype, 'safe'):
+        values = values.astype(array.dtype, copy=False)
+    idx = np.searchsorted(array, values, side='right') - 1
+    if idx.size and idx.min() < 0:
         warnings.warn('Given value smaller than first value')
-        idx[idx < 0] = 0
+        np.maximum(idx, 0, out=idx)
     return idx
 
+def _outer_hazards(bch_vals, expg, out_dtype='float32', block=(64, 1024), survival=False):
+    """Outer product `bch_vals[:, None] * expg[None, :]` as a (T, N) array of `out_dtype`.
+    If `survival`, returns `exp(-bch_vals[:, None] * expg[None, :])` instead. The product and
+    the exponential are then computed block-wise (`block` is (rows, cols)), so each block is
+    exponentiated right after it is written, rather than in a second pass over the full matrix.
+    """
+    out = np.empty((len(bch_vals), len(expg)), dtype=out_dtype)
+    if not survival:
+        return np.multiply.outer(bch_vals, expg, out=out)
+    n_rows, n_cols = block
+    for i in range(0, len(bch_vals), n_rows):
+        for j in range(0, len(expg), n_cols):
+            chunk = out[i:i+n_rows, j:j+n_cols]
+            np.multiply.outer(bch_vals[i:i+n_rows], expg[j:j+n_cols], out=chunk)
+            np.exp(np.negative(chunk, out=chunk), out=chunk)
+    return out
+
 
 class _CoxBase(models.base.SurvBase):
     duration_col = 'duration'
@@ -52,16 +70,58 @@ class _CoxBase(models.base.SurvBase):
                            num_workers, shuffle, metrics, val_data, val_batch_size,
                            **kwargs)
 
-    def _compute_baseline_hazards(self, input, df, max_duration, batch_size, eval_=True, num_workers=0):
+    def _compute_baseline_hazards(self, input, target, max_duration, batch_size, eval_=True, num_workers=0,
+                                  n_jobs=1, cumulative=False):
+        """Baseline hazards as a pd.Series. If `cumulative`, return a tuple with the baseline hazards
+        and the baseline cumulative hazards.
+        """
         raise NotImplementedError
 
+    def _predict_numpy(self, input, batch_size=8224, eval_=True, num_workers=0, n_jobs=1):
+        """Same as `self.predict(input, batch_size, numpy=True, ...)`, but the input is split in
+        `n_jobs` shards that are predicted in parallel threads (torch releases the GIL).
+        `n_jobs=-1` uses all cores.
+        """
+        n_jobs = joblib.effective_n_jobs(n_jobs)
+        if (n_jobs == 1) or tt.utils.is_dl(input):
+            return self.predict(input, batch_size, True, eval_, num_workers=num_workers)
+        input = tt.tuplefy(input)
+        n = input.lens().flatten().get_if_all_equal()
+        bounds = np.linspace(0, n, n_jobs + 1).astype('int64')
+        shards = [input.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        # `predict` calls `net.train()` when it's done, so we set the mode once for all threads.
+        if eval_:
+            self.net.eval()
+        try:
+            preds = joblib.Parallel(n_jobs=n_jobs, prefer='threads')(
+                joblib.delayed(self.predict)(shard, batch_size, True, False, num_workers=num_workers)
+                for shard in shards)
+        finally:
+            if eval_:
+                self.net.train()
+        return np.concatenate(preds)
+
     def target_to_df(self, target):
         durations, events = tt.tuplefy(target).to_numpy()
-        df = pd.DataFrame({self.duration_col: durations, self.event_col: events}) 
+        df = pd.DataFrame({self.duration_col: durations, self.event_col: events}, copy=False)
         return df
 
+    @staticmethod
+    def _target_to_arrays(target):
+        """Get `(durations, events)` as contiguous numpy arrays, with `events` as bool."""
+        durations, events = tt.tuplefy(target).to_numpy()
+        return np.ascontiguousarray(durations), np.ascontiguousarray(events, dtype=bool)
+
+    @staticmethod
+    def _sample_idx(n, sample):
+        """Index of a subsample without replacement. `sample` is the number of samples if >= 1,
+        and otherwise the fraction of `n`.
+        """
+        size = sample if sample >= 1 else int(round(sample * n))
+        return np.random.choice(n, size=size, replace=False)
+
     def compute_baseline_hazards(self, input=None, target=None, max_duration=None, sample=None, batch_size=8224,
-                                set_hazards=True, eval_=True, num_workers=0):
+                                set_hazards=True, eval_=True, num_workers=0, n_jobs=1):
         """Computes the Breslow estimates form the data defined by `input` and `target`
         (if `None` use training data).
 
@@ -75,6 +135,7 @@ class _CoxBase(models.base.SurvBase):
             sample {float or int} -- Compute estimates of subsample of data (default: {None})
             batch_size {int} -- Batch size (default: {8224})
             set_hazards {bool} -- Set hazards in model object, or just return hazards. (default: {True})
+            n_jobs {int} -- Number of threads used for prediction. -1 uses all cores. (default: {1})
         
         Returns:
             pd.Series -- Pandas series with baseline hazards. Index is duration_col.
@@ -83,41 +144,49 @@ class _CoxBase(models.base.SurvBase):
             if not hasattr(self, 'training_data'):
                 raise ValueError("Need to give a 'input' and 'target' to this function.")
             input, target = self.training_data
-        df = self.target_to_df(target)#.sort_values(self.duration_col)
+        durations, events = self._target_to_arrays(target)
         if sample is not None:
-            if sample >= 1:
-                df = df.sample(n=sample)
-            else:
-                df = df.sample(frac=sample)
-        input = tt.tuplefy(input).to_numpy().iloc[df.index.values]
-        base_haz = self._compute_baseline_hazards(input, df, max_duration, batch_size,
-                                                  eval_=eval_, num_workers=num_workers)
+            idx = self._sample_idx(len(durations), sample)
+            input = tt.tuplefy(input).to_numpy().iloc[idx]
+            durations, events = durations[idx], events[idx]
+        base_haz, bch = self._compute_baseline_hazards(input, (durations, events), max_duration, batch_size,
+                                                       eval_=eval_, num_workers=num_workers, n_jobs=n_jobs,
+                                                       cumulative=True)
         if set_hazards:
-            self.compute_baseline_cumulative_hazards(set_hazards=True, baseline_hazards_=base_haz)
+            self.baseline_hazards_ = base_haz
+            self.baseline_cumulative_hazards_ = bch
         return base_haz
 
     def compute_baseline_cumulative_hazards(self, input=None, target=None, max_duration=None, sample=None,
                                             batch_size=8224, set_hazards=True, baseline_hazards_=None,
-                                            eval_=True, num_workers=0):
+                                            eval_=True, num_workers=0, n_jobs=1):
         """See `compute_baseline_hazards. This is the cumulative version."""
         if ((input is not None) or (target is not None)) and (baseline_hazards_ is not None):
             raise ValueError("'input', 'target' and 'baseline_hazards_' can not both be different from 'None'.")
         if baseline_hazards_ is None:
             baseline_hazards_ = self.compute_baseline_hazards(input, target, max_duration, sample, batch_size,
-                                                             set_hazards=False, eval_=eval_, num_workers=num_workers)
+                                                             set_hazards=set_hazards, eval_=eval_,
+                                                             num_workers=num_workers, n_jobs=n_jobs)
+            if set_hazards:
+                return self.baseline_cumulative_hazards_
         assert baseline_hazards_.index.is_monotonic_increasing,\
             'Need index of baseline_hazards_ to be monotonic increasing, as it represents time.'
-        bch = (baseline_hazards_
-                .cumsum()
-                .rename('baseline_cumulative_hazards'))
+        bch = pd.Series(np.cumsum(baseline_hazards_.values), index=baseline_hazards_.index,
+                        name='baseline_cumulative_hazards')
         if set_hazards:
             self.baseline_hazards_ = baseline_hazards_
             self.baseline_cumulative_hazards_ = bch
         return bch
 
     def predict_cumulative_hazards(self, input, max_duration=None, batch_size=8224, verbose=False,
-                                   baseline_hazards_=None, eval_=True, num_workers=0):
-        """See `predict_survival_function`."""
+                                   baseline_hazards_=None, eval_=True, num_workers=0, n_jobs=1, device=None):
+        """See `predict_surv_df`."""
+        input, baseline_hazards_ = self._check_predict_input(input, baseline_hazards_)
+        return self._predict_cumulative_hazards(input, max_duration, batch_size, verbose, baseline_hazards_,
+                                                eval_, num_workers=num_workers, n_jobs=n_jobs, device=device)
+
+    def _check_predict_input(self, input, baseline_hazards_):
+        """Convert a DataFrame `input` with `df_to_input`, and get the baseline hazards to predict with."""
         if type(input) is pd.DataFrame:
             input = self.df_to_input(input)
         if baseline_hazards_ is None:
@@ -126,15 +195,17 @@ class _CoxBase(models.base.SurvBase):
             baseline_hazards_ = self.baseline_hazards_
         assert baseline_hazards_.index.is_monotonic_increasing,\
             'Need index of baseline_hazards_ to be monotonic increasing, as it represents time.'
-        return self._predict_cumulative_hazards(input, max_duration, batch_size, verbose, baseline_hazards_,
-                                                eval_, num_workers=num_workers)
+        return input, baseline_hazards_
 
     def _predict_cumulative_hazards(self, input, max_duration, batch_size, verbose, baseline_hazards_,
-                                    eval_=True, num_workers=0):
+                                    eval_=True, num_workers=0, n_jobs=1, _as_survival=False, device=None):
+        """Cumulative hazards as a DataFrame. If `_as_survival`, the survival function exp(-H) is
+        returned instead (computed in the same buffer).
+        """
         raise NotImplementedError
 
     def predict_surv_df(self, input, max_duration=None, batch_size=8224, verbose=False, baseline_hazards_=None,
-                        eval_=True, num_workers=0):
+                        eval_=True, num_workers=0, n_jobs=1, device=None):
         """Predict survival function for `input`. S(x, t) = exp(-H(x, t))
         Require computed baseline hazards.
 
@@ -147,15 +218,22 @@ class _CoxBase(models.base.SurvBase):
             baseline_hazards_ {pd.Series} -- Baseline hazards. If `None` used `model.baseline_hazards_` (default: {None})
             eval_ {bool} -- If 'True', use 'eval' mode on net. (default: {True})
             num_workers {int} -- Number of workers in created dataloader (default: {0})
+            n_jobs {int} -- Number of threads used for prediction. -1 uses all cores. Has no effect
+                when `device` is not `None`. (default: {1})
+            device {str, torch.device} -- Compute the survival estimates with torch on this device,
+                or with numpy if `None`. If 'auto', use the device of the net if it is a GPU.
+                (default: {None})
 
         Returns:
             pd.DataFrame -- Survival estimates. One columns for each individual.
         """
-        return np.exp(-self.predict_cumulative_hazards(input, max_duration, batch_size, verbose, baseline_hazards_,
-                                                       eval_, num_workers))
+        input, baseline_hazards_ = self._check_predict_input(input, baseline_hazards_)
+        return self._predict_cumulative_hazards(input, max_duration, batch_size, verbose, baseline_hazards_,
+                                                eval_, num_workers=num_workers, n_jobs=n_jobs, _as_survival=True,
+                                                device=device)
 
     def predict_surv(self, input, max_duration=None, batch_size=8224, numpy=None, verbose=False,
-                     baseline_hazards_=None, eval_=True, num_workers=0):
+                     baseline_hazards_=None, eval_=True, num_workers=0, n_jobs=1, device=None):
         """Predict survival function for `input`. S(x, t) = exp(-H(x, t))
         Require compueted baseline hazards.
 
@@ -170,12 +248,17 @@ class _CoxBase(models.base.SurvBase):
             baseline_hazards_ {pd.Series} -- Baseline hazards. If `None` used `model.baseline_hazards_` (default: {None})
             eval_ {bool} -- If 'True', use 'eval' mode on net. (default: {True})
             num_workers {int} -- Number of workers in created dataloader (default: {0})
+            n_jobs {int} -- Number of threads used for prediction. -1 uses all cores. Has no effect
+                when `device` is not `None`. (default: {1})
+            device {str, torch.device} -- Compute the survival estimates with torch on this device,
+                or with numpy if `None`. If 'auto', use the device of the net if it is a GPU.
+                (default: {None})
 
         Returns:
             pd.DataFrame -- Survival estimates. One columns for each individual.
         """
         surv = self.predict_surv_df(input, max_duration, batch_size, verbose, baseline_hazards_,
-                                    eval_, num_workers)
+                                    eval_, num_workers, n_jobs, device)
         surv = torch.from_numpy(surv.values.transpose())
         return tt.utils.array_or_tensor(surv, numpy, input)
 
@@ -197,7 +280,25 @@ class _CoxBase(models.base.SurvBase):
         extension = '.'+extension
         super().save_net(path+extension, **kwargs)
         if hasattr(self, 'baseline_hazards_'):
-            self.baseline_hazards_.to_pickle(path+'_blh.pickle')
+            self._save_baseline_hazards(path+'_blh.npz')
+
+    def _save_baseline_hazards(self, path):
+        """Save `baseline_hazards_` and `baseline_cumulative_hazards_` to the npz file `path`.
+        The cumulative hazards are computed from `baseline_hazards_` if they are not set.
+        """
+        cumulative = getattr(self, 'baseline_cumulative_hazards_', None)
+        cumulative = np.cumsum(self.baseline_hazards_.values) if cumulative is None else cumulative.values
+        np.savez(path, index=self.baseline_hazards_.index.values, values=self.baseline_hazards_.values,
+                 cumulative=cumulative)
+
+    def _load_baseline_hazards(self, path):
+        """Set `baseline_hazards_` and `baseline_cumulative_hazards_` from the npz file `path`."""
+        with np.load(path) as blh:
+            index = pd.Index(blh['index'], name=self.duration_col)
+            self.baseline_hazards_ = pd.Series(blh['values'], index=index, name='baseline_hazards',
+                                               copy=False)
+            self.baseline_cumulative_hazards_ = pd.Series(blh['cumulative'], index=index,
+                                                          name='baseline_cumulative_hazards', copy=False)
 
     def load_net(self, path, **kwargs):
         """Load net and hazards from file.
@@ -216,47 +317,97 @@ class _CoxBase(models.base.SurvBase):
             extension = path_list[1]
         extension = '.'+extension
         super().load_net(path+extension, **kwargs)
-        blh_path = path+'_blh.pickle'
-        if os.path.isfile(blh_path):
-            self.baseline_hazards_ = pd.read_pickle(blh_path)
+        if os.path.isfile(path+'_blh.npz'):
+            self._load_baseline_hazards(path+'_blh.npz')
+        elif os.path.isfile(path+'_blh.pickle'):
+            # Legacy format
+            self.baseline_hazards_ = pd.read_pickle(path+'_blh.pickle')
             self.baseline_cumulative_hazards_ = self.baseline_hazards_.cumsum()
 
     def df_to_input(self, df):
-        input = df[self.input_cols].values
+        """Numeric float32 array of `df[self.input_cols]`.
+        Columns of type 'object', 'category' or 'string' are not encoded here, as the encoding
+        would depend on the data at hand. Encode them (with the mapping used for training) before
+        calling this.
+        """
+        df = df[self.input_cols]
+        non_numeric = [col for col in self.input_cols
+                       if df[col].dtype.name in ('object', 'category', 'string')]
+        if non_numeric:
+            raise ValueError(f"Columns {non_numeric} are not numeric. Encode them before prediction.")
+        input = df.to_numpy(dtype='float32', copy=False)
         return input
     
 
 class _CoxPHBase(_CoxBase):
-    def _compute_baseline_hazards(self, input, df_target, max_duration, batch_size, eval_=True, num_workers=0):
+    def _predict_expg(self, input, batch_size=8224, eval_=True, num_workers=0, n_jobs=1):
+        """Get `exp(self.predict(input))` as a flat float32 array."""
+        expg = self._predict_numpy(input, batch_size, eval_, num_workers, n_jobs)
+        expg = expg.astype('float32', copy=False).ravel()
+        np.exp(expg, out=expg) # The predictions are a fresh array, so we reuse it
+        return expg
+
+    def _compute_baseline_hazards(self, input, target, max_duration, batch_size, eval_=True, num_workers=0,
+                                  n_jobs=1, cumulative=False):
         if max_duration is None:
             max_duration = np.inf
 
         # Here we are computing when expg when there are no events.
         #   Could be made faster, by only computing when there are events.
-        return (df_target
-                .assign(expg=np.exp(self.predict(input, batch_size, True, eval_, num_workers=num_workers)))
-                .groupby(self.duration_col)
-                .agg({'expg': 'sum', self.event_col: 'sum'})
-                .sort_index(ascending=False)
-                .assign(expg=lambda x: x['expg'].cumsum())
-                .pipe(lambda x: x[self.event_col]/x['expg'])
-                .fillna(0.)
-                .iloc[::-1]
-                .loc[lambda x: x.index <= max_duration]
-                .rename('baseline_hazards'))
+        expg = self._predict_expg(input, batch_size, eval_, num_workers, n_jobs)
+        durations, events = target
+        order = np.argsort(-durations, kind='stable')
+        durations, events, expg = durations[order], events[order], expg[order]
+        at_risk = np.cumsum(expg)
+        n_events = events.astype(expg.dtype, copy=False)
+        is_new = durations[1:] != durations[:-1]
+        if not is_new.all():
+            # Blocks of equal durations. The risk set sum is the cumsum at the end of each block.
+            starts = np.r_[0, np.flatnonzero(is_new) + 1]
+            ends = np.r_[starts[1:], len(durations)] - 1
+            at_risk = at_risk[ends]
+            n_events = np.add.reduceat(n_events, starts)
+            durations = durations[starts]
+        base_haz = n_events / at_risk
+        base_haz[np.isnan(base_haz)] = 0.
+        durations, base_haz = durations[::-1], base_haz[::-1]
+        keep = durations <= max_duration
+        index = pd.Index(durations[keep], name=self.duration_col)
+        base_haz = base_haz[keep]
+        base_haz_series = pd.Series(base_haz, index=index, name='baseline_hazards')
+        if not cumulative:
+            return base_haz_series
+        bch = pd.Series(np.cumsum(base_haz), index=index, name='baseline_cumulative_hazards')
+        return base_haz_series, bch
 
     def _predict_cumulative_hazards(self, input, max_duration, batch_size, verbose, baseline_hazards_,
-                                    eval_=True, num_workers=0):
+                                    eval_=True, num_workers=0, n_jobs=1, _as_survival=False, device=None):
+        """See `_CoxBase._predict_cumulative_hazards`.
+        The (T, N) matrix is computed with torch on `device`, or with numpy if `device` is `None`.
+        If `device` is 'auto', torch is used when the net is on a GPU, so only the result is
+        transferred to the host. The torch path predicts in a single thread, so `n_jobs` is ignored.
+        """
         max_duration = np.inf if max_duration is None else max_duration
+        if device == 'auto':
+            device = self.device if self.device.type == 'cuda' else None
         if baseline_hazards_ is self.baseline_hazards_:
             bch = self.baseline_cumulative_hazards_
         else:
             bch = self.compute_baseline_cumulative_hazards(set_hazards=False, 
                                                            baseline_hazards_=baseline_hazards_)
         bch = bch.loc[lambda x: x.index <= max_duration]
-        expg = np.exp(self.predict(input, batch_size, True, eval_, num_workers=num_workers)).reshape(1, -1)
-        return pd.DataFrame(bch.values.reshape(-1, 1).dot(expg), 
-                            index=bch.index)
+        if device is None:
+            expg = self._predict_expg(input, batch_size, eval_, num_workers, n_jobs)
+            hazards = _outer_hazards(bch.values, expg, survival=_as_survival)
+        else:
+            expg = self.predict(input, batch_size, False, eval_, num_workers=num_workers)
+            expg = expg.to(device=device, dtype=torch.float32).view(-1).exp_()
+            bch_t = torch.as_tensor(bch.values, dtype=torch.float32, device=device)
+            hazards = bch_t.unsqueeze(1) * expg.unsqueeze(0)
+            if _as_survival:
+                hazards.neg_().exp_()
+            hazards = hazards.cpu().numpy()
+        return pd.DataFrame(hazards, index=bch.index, copy=False)
 
     def partial_log_likelihood(self, input, target, g_preds=None, batch_size=8224, eps=1e-7, eval_=True,
                                num_workers=0):
@@ -277,20 +428,40 @@ class _CoxPHBase(_CoxBase):
         Returns:
             Partial log-likelihood.
         '''
-        df = self.target_to_df(target)
+        durations, events = self._target_to_arrays(target)
+        if g_preds is None:
+            g_preds = self.predict(input, batch_size, True, eval_, num_workers=num_workers)
+        order = np.argsort(-durations, kind='stable')
+        durations, events, g_preds = durations[order], events[order], np.asarray(g_preds).ravel()[order]
+        # All individuals with the same duration share the cumsum at the end of their block.
+        is_end = np.ones(len(durations), dtype=bool)
+        is_end[:-1] = durations[1:] != durations[:-1]
+        ends = np.flatnonzero(is_end)
+        cum_exp_g = np.repeat(np.cumsum(np.exp(g_preds))[ends], np.diff(np.r_[-1, ends]))
+        pll = g_preds[events] - np.log(cum_exp_g[events] + eps)
+        return pd.Series(pll, index=order[events], name='pll')
+
+    def concordance_index(self, input, target, g_preds=None, batch_size=8224, eval_=True, num_workers=0):
+        """Harrell's concordance index of the predictions `g(x)`.
+        See `pycox.evaluation.concordance.concordance_index`.
+
+        Arguments:
+            input {tuple, np.ndarray, or torch.tensor} -- Input to net.
+            target {tuple, np.ndarray, or torch.tensor} -- Target labels.
+
+        Keyword Arguments:
+            g_preds {np.array} -- Predictions from `model.predict` (default: {None})
+            batch_size {int} -- Batch size (default: {8224})
+            eval_ {bool} -- If 'True', use 'eval' mode on net. (default: {True})
+            num_workers {int} -- Number of workers in created dataloader (default: {0})
+
+        Returns:
+            float -- Concordance index.
+        """
+        durations, events = self._target_to_arrays(target)
         if g_preds is None:
             g_preds = self.predict(input, batch_size, True, eval_, num_workers=num_workers)
-        return (df
-                .assign(_g_preds=g_preds)
-                .sort_values(self.duration_col, ascending=False)
-                .assign(_cum_exp_g=(lambda x: x['_g_preds']
-                                    .pipe(np.exp)
-                                    .cumsum()
-                                    .groupby(x[self.duration_col])
-                                    .transform('max')))
-                .loc[lambda x: x[self.event_col] == 1]
-                .assign(pll=lambda x: x['_g_preds'] - np.log(x['_cum_exp_g'] + eps))
-                ['pll'])
+        return concordance_index(durations, events, np.asarray(g_preds).ravel())
 
 
 class CoxPH(_CoxPHBase):
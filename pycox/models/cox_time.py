@@ -49,41 +49,38 @@ class CoxTime(models.cox_cc._CoxCCBase):
         return dataloader
 
     def predict_surv_df(self, input, max_duration=None, batch_size=8224, verbose=False, baseline_hazards_=None,
-                        eval_=True, num_workers=0):
+                        eval_=True, num_workers=0, n_jobs=1, device=None):
         surv = super().predict_surv_df(input, max_duration, batch_size, verbose, baseline_hazards_,
-                                       eval_, num_workers)
+                                       eval_, num_workers, n_jobs, device)
         if self.labtrans is not None:
             surv.index = self.labtrans.map_scaled_to_orig(surv.index)
         return surv
 
     def compute_baseline_hazards(self, input=None, target=None, max_duration=None, sample=None, batch_size=8224,
-                                set_hazards=True, eval_=True, num_workers=0):
+                                set_hazards=True, eval_=True, num_workers=0, n_jobs=1):
         if (input is None) and (target is None):
             if not hasattr(self, 'training_data'):
                 raise ValueError('Need to fit, or supply a input and target to this function.')
             input, target = self.training_data
         df = self.target_to_df(target)
         if sample is not None:
-            if sample >= 1:
-                df = df.sample(n=sample)
-            else:
-                df = df.sample(frac=sample)
+            df = df.iloc[self._sample_idx(len(df), sample)]
             df = df.sort_values(self.duration_col)
         input = tt.tuplefy(input).to_numpy().iloc[df.index.values]
-        base_haz = self._compute_baseline_hazards(input, df, max_duration, batch_size, eval_, num_workers)
+        base_haz = self._compute_baseline_hazards(input, df, max_duration, batch_size, eval_, num_workers, n_jobs)
         if set_hazards:
             self.compute_baseline_cumulative_hazards(set_hazards=True, baseline_hazards_=base_haz)
         return base_haz
 
     def _compute_baseline_hazards(self, input, df_train_target, max_duration, batch_size, eval_=True,
-                                  num_workers=0):
+                                  num_workers=0, n_jobs=1):
         if max_duration is None:
             max_duration = np.inf
         def compute_expg_at_risk(ix, t):
             sub = input.iloc[ix:]
             n = sub.lens().flatten().get_if_all_equal()
             t = np.repeat(t, n).reshape(-1, 1).astype('float32')
-            return np.exp(self.predict((sub, t), batch_size, True, eval_, num_workers=num_workers)).flatten().sum()
+            return np.exp(self._predict_numpy((sub, t), batch_size, eval_, num_workers, n_jobs)).flatten().sum()
 
         if not df_train_target[self.duration_col].is_monotonic_increasing:
             raise RuntimeError(f"Need 'df_train_target' to be sorted by {self.duration_col}")
@@ -110,15 +107,17 @@ class CoxTime(models.cox_cc._CoxCCBase):
         return base_haz
 
     def _predict_cumulative_hazards(self, input, max_duration, batch_size, verbose, baseline_hazards_,
-                                    eval_=True, num_workers=0):
+                                    eval_=True, num_workers=0, n_jobs=1, _as_survival=False, device=None):
         def expg_at_time(t):
             t = np.repeat(t, n_cols).reshape(-1, 1).astype('float32')
             if tt.tuplefy(input).type() is torch.Tensor:
                 t = torch.from_numpy(t)
-            return np.exp(self.predict((input, t), batch_size, True, eval_, num_workers=num_workers)).flatten()
+            return np.exp(self._predict_numpy((input, t), batch_size, eval_, num_workers, n_jobs)).flatten()
 
         if tt.utils.is_dl(input):
             raise NotImplementedError(f"Prediction with a dataloader as input is not supported ")
+        if device is not None:
+            raise NotImplementedError("Prediction with torch (`device`) is not supported for CoxTime")
         input = tt.tuplefy(input)
         max_duration = np.inf if max_duration is None else max_duration
         baseline_hazards_ = baseline_hazards_.loc[lambda x: x.index <= max_duration]
@@ -130,7 +129,10 @@ class CoxTime(models.cox_cc._CoxCCBase):
             hazards[idx, :] = expg_at_time(t)
         hazards[baseline_hazards_.values == 0] = 0.  # in case hazards are inf here
         hazards *= baseline_hazards_.values.reshape(-1, 1)
-        return pd.DataFrame(hazards, index=baseline_hazards_.index).cumsum()
+        np.cumsum(hazards, axis=0, out=hazards)
+        if _as_survival:
+            np.exp(np.negative(hazards, out=hazards), out=hazards)
+        return pd.DataFrame(hazards, index=baseline_hazards_.index, copy=False)
 
     def partial_log_likelihood(self, input, target, batch_size=8224, eval_=True, num_workers=0):
         def expg_sum(t, i):
@@ -413,13 +413,19 @@ def cox_ph_loss_sorted(log_h: Tensor, events: Tensor, eps: float = 1e-7) -> Tens
 
     We just compute a cumulative sum, and not the true Risk sets. This is a
     limitation, but simple and fast.
+
+    The risk-set sums are computed with `torch.logcumsumexp`. `eps` is only used by the
+    fallback for torch < 1.6, which does not have `torch.logcumsumexp`.
     """
     if events.dtype is torch.bool:
         events = events.float()
     events = events.view(-1)
     log_h = log_h.view(-1)
-    gamma = log_h.max()
-    log_cumsum_h = log_h.sub(gamma).exp().cumsum(0).add(eps).log().add(gamma)
+    if hasattr(torch, 'logcumsumexp'):
+        log_cumsum_h = torch.logcumsumexp(log_h, 0)
+    else:
+        gamma = log_h.max()
+        log_cumsum_h = log_h.sub(gamma).exp().cumsum(0).add(eps).log().add(gamma)
     return - log_h.sub(log_cumsum_h).mul(events).sum().div(events.sum())
 
 def cox_ph_loss(log_h: Tensor, durations: Tensor, events: Tensor, eps: float = 1e-7) -> Tensor:
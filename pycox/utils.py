@@ -20,7 +20,8 @@ def idx_at_times(index_surv, times, steps='pre', assert_sorted=True):
         np.array -- Index of `index_surv` that is closest to `times`
     """
     if assert_sorted:
-        assert pd.Series(index_surv).is_monotonic_increasing, "Need 'index_surv' to be monotonic increasing"
+        index_surv = np.asarray(index_surv)
+        assert (index_surv[1:] >= index_surv[:-1]).all(), "Need 'index_surv' to be monotonic increasing"
     if steps == 'pre':
         idx = np.searchsorted(index_surv, times)
     elif steps == 'post':
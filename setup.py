@@ -27,6 +27,7 @@ requirements = [
     'h5py>=2.9.0',
     'numba>=0.44',
     'scikit-learn>=0.21.2',
+    'joblib>=0.13.2',
     'requests>=2.22.0',
 ]
 
@@ -0,0 +1,25 @@
+import pytest
+import numpy as np
+from pycox.evaluation.concordance import concordance_index
+
+
+def test_concordance_index_perfect():
+    durations = np.array([1., 2., 3., 4.])
+    events = np.array([1, 1, 0, 1])
+    assert concordance_index(durations, events, -durations) == 1.
+    assert concordance_index(durations, events, durations) == 0.
+    assert concordance_index(durations, events, np.zeros(4)) == 0.5
+    assert concordance_index(durations.reshape(-1, 1), events.reshape(-1, 1), -durations.reshape(-1, 1)) == 1.
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('n', [10, 85, 259])
+def test_concordance_index_vs_lifelines(seed, n):
+    from lifelines.utils import concordance_index as concordance_index_lifelines
+    np.random.seed(seed)
+    durations = np.random.randint(0, 20, n).astype('float')
+    events = np.random.binomial(1, 0.6, n)
+    events[0] = 1
+    risk = np.random.randint(0, 5, n).astype('float')
+    c_index = concordance_index(durations, events, risk)
+    c_index_lifelines = concordance_index_lifelines(durations, -risk, events)
+    assert abs(c_index - c_index_lifelines) < 1e-12
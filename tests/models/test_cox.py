@@ -1,9 +1,13 @@
 import pytest
+import numpy as np
+import pandas as pd
+import torch
 import torchtuples as tt
 from pycox.models import CoxPH
+from pycox.models.cox import search_sorted_idx
 from pycox.models.cox_time import MLPVanillaCoxTime
 
-from utils_model_testing import make_dataset, fit_model, assert_survs
+from utils_model_testing import make_dataset, fit_model, assert_survs, make_fitted_cox_ph
 
 
 @pytest.mark.parametrize('numpy', [True, False])
@@ -16,3 +20,137 @@ def test_cox_cc_runs(numpy):
     fit_model(data, model)
     model.compute_baseline_hazards()
     assert_survs(data[0], model)
+
+
+def test_search_sorted_idx():
+    array = np.array([0., 1., 2., 5.])
+    values = np.array([0., 0.5, 2., 4.9, 5., 10.])
+    idx = search_sorted_idx(array, values)
+    assert (idx == np.array([0, 0, 2, 2, 3, 3])).all()
+    with pytest.warns(UserWarning):
+        idx = search_sorted_idx(array, np.array([-1., 1.]))
+    assert (idx == np.array([0, 1])).all()
+    idx = search_sorted_idx(np.float32([0, 1, 2]), np.float64([1.99999999, 0.99999999, 1.0000001]))
+    assert (idx == np.array([1, 0, 1])).all()
+
+
+@pytest.mark.parametrize('n_jobs', [2, 3])
+def test_predict_n_jobs(n_jobs):
+    data, model = make_fitted_cox_ph()
+    base_haz = model.compute_baseline_hazards()
+    assert (model.compute_baseline_hazards(n_jobs=n_jobs) - base_haz).abs().max() < 1e-6
+    surv = model.predict_surv_df(data[0])
+    assert (model.predict_surv_df(data[0], n_jobs=n_jobs) - surv).abs().max().max() < 1e-6
+
+
+@pytest.mark.parametrize('sample', [20, 0.25])
+def test_compute_baseline_hazards_sample(sample):
+    data, model = make_fitted_cox_ph()
+    input, (durations, events) = data
+    np.random.seed(0)
+    base_haz = model.compute_baseline_hazards(*data, sample=sample, set_hazards=False)
+    np.random.seed(0)
+    idx = np.random.choice(len(durations), size=20, replace=False)
+    expected = model.compute_baseline_hazards(input[idx], (durations[idx], events[idx]), set_hazards=False)
+    pd.testing.assert_series_equal(base_haz, expected)
+    assert not hasattr(model, 'baseline_hazards_')
+
+
+@pytest.mark.parametrize('ties', [True, False])
+@pytest.mark.parametrize('max_duration', [None, 5.5])
+def test_compute_baseline_hazards_vs_groupby(ties, max_duration):
+    data, model = make_fitted_cox_ph()
+    input, (durations, events) = data
+    if not ties:
+        durations = durations + np.random.uniform(0, 0.5, len(durations)).astype('float32')
+        assert len(np.unique(durations)) == len(durations)
+    base_haz = model.compute_baseline_hazards(input, (durations, events), max_duration, set_hazards=False)
+    expected = (pd.DataFrame({'duration': durations, 'event': events})
+                .assign(expg=np.exp(model.predict(input)).ravel())
+                .groupby('duration')
+                .agg({'expg': 'sum', 'event': 'sum'})
+                .sort_index(ascending=False)
+                .assign(expg=lambda x: x['expg'].cumsum())
+                .pipe(lambda x: x['event']/x['expg'])
+                .fillna(0.)
+                .iloc[::-1]
+                .loc[lambda x: x.index <= (np.inf if max_duration is None else max_duration)])
+    assert (base_haz.index.values == expected.index.values).all()
+    np.testing.assert_allclose(base_haz.values, expected.values, rtol=1e-5)
+
+
+def test_save_load_baseline_hazards(tmp_path):
+    data, model = make_fitted_cox_ph()
+    model.compute_baseline_hazards()
+    path = str(tmp_path / 'net_blh.npz')
+    model._save_baseline_hazards(path)
+    loaded = CoxPH(tt.practical.MLPVanilla(data[0].shape[1], [4], 1, False, output_bias=False))
+    loaded._load_baseline_hazards(path)
+    pd.testing.assert_series_equal(loaded.baseline_hazards_, model.baseline_hazards_)
+    pd.testing.assert_series_equal(loaded.baseline_cumulative_hazards_, model.baseline_cumulative_hazards_)
+    loaded.net.load_state_dict(model.net.state_dict())
+    assert (loaded.predict_surv_df(data[0]).values == model.predict_surv_df(data[0]).values).all()
+    del model.baseline_cumulative_hazards_
+    model._save_baseline_hazards(path)
+    loaded._load_baseline_hazards(path)
+    np.testing.assert_allclose(loaded.baseline_cumulative_hazards_.values,
+                               np.cumsum(model.baseline_hazards_.values))
+
+def test_partial_log_likelihood_ties():
+    data, model = make_fitted_cox_ph()
+    durations, events = data[1]
+    g_preds = model.predict(data[0]).ravel()
+    pll = model.partial_log_likelihood(*data, g_preds=g_preds)
+    df = pd.DataFrame({'duration': durations, 'event': events, 'g': g_preds})
+    expected = (df
+                .sort_values('duration', ascending=False)
+                .assign(cum_exp_g=lambda x: x['g'].pipe(np.exp).cumsum().groupby(x['duration']).transform('max'))
+                .loc[lambda x: x['event'] == 1]
+                .assign(pll=lambda x: x['g'] - np.log(x['cum_exp_g'] + 1e-7))
+                ['pll'])
+    assert len(pll) == events.sum()
+    np.testing.assert_allclose(pll.sort_index().values, expected.sort_index().values, rtol=1e-5)
+    assert (pll.sort_index().index == expected.sort_index().index).all()
+    empty = np.array([], dtype='float32')
+    assert len(model.partial_log_likelihood(None, (empty, empty), g_preds=empty)) == 0
+
+
+def test_concordance_index():
+    data, model = make_fitted_cox_ph()
+    c_index = model.concordance_index(*data)
+    assert 0 <= c_index <= 1
+    durations, events = data[1]
+    assert model.concordance_index(None, data[1], g_preds=-durations) == 1.
+
+
+def test_df_to_input_rejects_non_numeric():
+    net = tt.practical.MLPVanilla(3, [4], 1, False, output_bias=False)
+    model = CoxPH(net)
+    model.input_cols = ['x', 'c', 'k']
+    df = pd.DataFrame({'x': [0.5, 1., 2.], 'c': [1, 0, 1], 'k': [0., 1., 0.], 'other': ['not', 'used', '!']})
+    input = model.df_to_input(df)
+    assert input.dtype == np.float32
+    assert (input == np.array([[0.5, 1, 0], [1, 0, 1], [2, 1, 0]])).all()
+    with pytest.raises(ValueError):
+        model.df_to_input(df.assign(c=['b', 'a', 'b']))
+    with pytest.raises(ValueError):
+        model.df_to_input(df.assign(k=pd.Categorical(['u', 'v', 'u'])))
+    with pytest.raises(ValueError):
+        model.df_to_input(df.assign(c=pd.Series(['b', 'a', 'b'], dtype='string')))
+
+
+@pytest.mark.parametrize('net_device, device', [
+    ('cpu', 'cpu'),
+    pytest.param('cuda', 'auto', marks=pytest.mark.skipif(not torch.cuda.is_available(), reason='needs cuda')),
+])
+def test_predict_torch_device(net_device, device):
+    data, model = make_fitted_cox_ph()
+    model.set_device(net_device)
+    model.compute_baseline_hazards()
+    for predict in [model.predict_cumulative_hazards, model.predict_surv_df]:
+        res_np = predict(data[0])
+        res_torch = predict(data[0], device=device)
+        assert (res_np.index == res_torch.index).all()
+        assert np.abs(res_np.values - res_torch.values).max() < 1e-6
+    surv = model.predict_surv(data[0], device=device)
+    assert np.abs(surv - model.predict_surv(data[0])).max() < 1e-6
@@ -19,3 +19,18 @@ def test_cox_time_runs(numpy):
     fit_model(data, model)
     model.compute_baseline_hazards()
     assert_survs(data[0], model, with_dl=False)
+
+
+def test_cox_time_n_jobs():
+    input, target = make_dataset(False).apply(lambda x: x.float()).to_numpy()
+    labtrans = CoxTime.label_transform()
+    target = labtrans.fit_transform(*target)
+    net = MLPVanillaCoxTime(input.shape[1], [4], False)
+    model = CoxTime(net)
+    fit_model(tt.tuplefy(input, target), model)
+    base_haz = model.compute_baseline_hazards()
+    assert (model.compute_baseline_hazards(n_jobs=2) - base_haz).abs().max() < 1e-6
+    surv = model.predict_surv_df(input)
+    assert (model.predict_surv_df(input, n_jobs=2) - surv).abs().max().max() < 1e-6
+    with pytest.raises(NotImplementedError):
+        model.predict_surv_df(input, device='cpu')
@@ -102,3 +102,23 @@ def test_nll_mtlr_zero():
     loss_pmf = loss.nll_pmf(phi, idx_durations, events)
     loss_mtlr = loss.nll_mtlr(phi, idx_durations, events)
     assert (loss_pmf - loss_mtlr).abs() == 0 
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('scale', [1., 100.])
+@pytest.mark.parametrize('logcumsumexp', [True, False])
+def test_cox_ph_loss_sorted(seed, scale, logcumsumexp, monkeypatch):
+    if not logcumsumexp:
+        monkeypatch.delattr(torch, 'logcumsumexp', raising=False)
+    torch.manual_seed(seed)
+    n = 50
+    log_h = torch.randn(n, dtype=torch.float64) * scale
+    events = (torch.rand(n) < 0.7).double()
+    events[0] = 1.
+    expected = -(log_h - log_h.exp().cumsum(0).log()).mul(events).sum() / events.sum()
+    res = loss.cox_ph_loss_sorted(log_h, events)
+    assert torch.isfinite(res)
+    if scale == 1.:
+        assert (res - expected).abs() < 1e-6
+    res_float = loss.cox_ph_loss_sorted(log_h.float(), events.float())
+    assert torch.isfinite(res_float)
+    assert (res_float.double() - res).abs() < 1e-3 * (1 + res.abs())
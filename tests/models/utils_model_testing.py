@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 import torch
 import torchtuples as tt
+from pycox.models import CoxPH
 
 def make_dataset(numpy):
     n_events = 2
@@ -41,3 +42,11 @@ def assert_survs(input, model, with_dl=True):
         dl_preds = model.predict_surv(dl_input)
         assert type(np_preds) is type(dl_preds), f"got {type(np_preds)}, and, {type(dl_preds)}"
         assert (np_preds == dl_preds).all()
+
+def make_fitted_cox_ph():
+    """Returns `(data, model)` with a CoxPH model fitted to `make_dataset`."""
+    data = make_dataset(False).apply(lambda x: x.float()).to_numpy()
+    net = tt.practical.MLPVanilla(data[0].shape[1], [4], 1, False, output_bias=False)
+    model = CoxPH(net)
+    fit_model(data, model)
+    return data, model